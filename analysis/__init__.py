@@ -1,3 +1,4 @@
+from ._constants import GOOD_ACTIONS, GOOD_ACTIONS_ARR
 from .queries import get_engine, load_timeseries, load_price_history
 from .features import engineer_features
-from .predictions import predict_price, deal_probability
+from .predictions import predict_price, deal_probability, deal_probability_from_heatmap
@@ -0,0 +1,5 @@
+import numpy as np
+
+# Actions counted as a "good deal" across features, predictions and SQL aggregates
+GOOD_ACTIONS = frozenset({"SUPER", "GOOD DEAL", "BIG DISCOUNT", "VERY CHEAP", "CHEAP UPPER MID"})
+GOOD_ACTIONS_ARR = np.array(sorted(GOOD_ACTIONS), dtype=object)
@@ -1,6 +1,8 @@
 import pandas as pd
 import numpy as np
 
+from ._constants import GOOD_ACTIONS_ARR
+
 DAY_NAMES = ["Sun", "Mon", "Tue", "Wed", "Thu", "Fri", "Sat"]
 MONTH_NAMES = ["Jan", "Feb", "Mar", "Apr", "May", "Jun",
                "Jul", "Aug", "Sep", "Oct", "Nov", "Dec"]
@@ -10,20 +12,38 @@ SEASON_MAP = {12: "Winter", 1: "Winter", 2: "Winter",
               6:  "Summer", 7: "Summer", 8: "Summer",
               9:  "Autumn", 10: "Autumn", 11: "Autumn"}
 
+# Lookup tables for vectorized indexing (season is indexed directly by month 1..12)
+_DAY_ARR    = np.array(DAY_NAMES, dtype=object)
+_MONTH_ARR  = np.array(MONTH_NAMES, dtype=object)
+_SEASON_ARR = np.array([""] + [SEASON_MAP[m] for m in range(1, 13)], dtype=object)
+
+
+def good_action_mask(action: pd.Series) -> np.ndarray:
+    """Boolean array: is each row's action one of GOOD_ACTIONS?"""
+    if isinstance(action.dtype, pd.CategoricalDtype):
+        # Test the few categories once, then gather by code (-1/NaN → trailing False)
+        good = np.append(action.cat.categories.isin(GOOD_ACTIONS_ARR), False)
+        return good[action.cat.codes.to_numpy()]
+    return np.isin(action.to_numpy(), GOOD_ACTIONS_ARR)
+
 
 def engineer_features(df: pd.DataFrame) -> pd.DataFrame:
-    df = df.copy()
-    df["fetched_at"] = pd.to_datetime(df["fetched_at"], format='ISO8601')
-    if "date" in df.columns:
-        df["date"] = pd.to_datetime(df["date"])
-    df["day_name"]   = df["day_of_week"].map(lambda d: DAY_NAMES[int(d)])
-    df["month_name"] = df["month"].map(lambda m: MONTH_NAMES[int(m) - 1])
-    df["season"]     = df["month"].map(lambda m: SEASON_MAP[int(m)])
-    df["is_weekend"]  = df["day_of_week"].isin([0, 6])
-    df["is_good_deal"] = df["action"].isin(
-        ["SUPER", "GOOD DEAL", "BIG DISCOUNT", "VERY CHEAP", "CHEAP UPPER MID"]
+    # assign() returns a new frame without deep-copying the untouched columns
+    fetched_at = pd.to_datetime(df["fetched_at"], format='ISO8601')
+    dates = {"date": pd.to_datetime(df["date"])} if "date" in df.columns else {}
+
+    dow   = df["day_of_week"].to_numpy(dtype=np.int8)
+    month = df["month"].to_numpy(dtype=np.int8)
+    is_good_deal = good_action_mask(df["action"])
+    t = fetched_at.to_numpy("datetime64[ns]")
+
+    return df.assign(
+        fetched_at=fetched_at,
+        **dates,
+        day_name=_DAY_ARR[dow],
+        month_name=_MONTH_ARR[month - 1],
+        season=_SEASON_ARR[month],
+        is_weekend=(dow == 0) | (dow == 6),
+        is_good_deal=is_good_deal,
+        days_since_start=(t - t.min()) / np.timedelta64(1, "D"),
     )
-    df["days_since_start"] = (
-        df["fetched_at"] - df["fetched_at"].min()
-    ).dt.total_seconds() / 86400
-    return df
@@ -1,12 +1,50 @@
+import functools
+from collections import OrderedDict
+from math import erfc, sqrt
+
 import numpy as np
 import pandas as pd
-from scipy import stats
+
+from .features import DAY_NAMES, good_action_mask
+
+
+# ---------------------------------------------------------------------------
+# Memoization — dashboards re-request the same slice until new data arrives
+# ---------------------------------------------------------------------------
+
+def _slice_key(df: pd.DataFrame) -> tuple:
+    """Row count plus a content hash of the columns the memoized functions read (fetched_at, promo_price)."""
+    rows = pd.util.hash_pandas_object(df[["fetched_at", "promo_price"]], index=False)
+    return len(df), int(rows.sum())
+
+
+def _memoize_slice(maxsize: int = 512):
+    """LRU cache keyed on _slice_key(df) plus the remaining arguments."""
+    def decorator(fn):
+        cache = OrderedDict()
+
+        @functools.wraps(fn)
+        def wrapper(df, *args, **kwargs):
+            key = (_slice_key(df), args, tuple(sorted(kwargs.items())))
+            if key in cache:
+                cache.move_to_end(key)
+                return cache[key]
+            result = fn(df, *args, **kwargs)
+            cache[key] = result
+            if len(cache) > maxsize:
+                cache.popitem(last=False)
+            return result
+
+        wrapper.cache_clear = cache.clear
+        return wrapper
+    return decorator
 
 
 # ---------------------------------------------------------------------------
 # Price prediction — polynomial trend on historical promo prices
 # ---------------------------------------------------------------------------
 
+@_memoize_slice()
 def predict_price(df: pd.DataFrame, horizon_days: int = 30, deg: int = 2):
     """
     Fit a polynomial trend to historical promo prices and project forward.
@@ -21,30 +59,39 @@ def predict_price(df: pd.DataFrame, horizon_days: int = 30, deg: int = 2):
           - expected_min_in_horizon : predicted minimum in the horizon window
           - trend            : 'falling' | 'rising' | 'stable'
     """
-    df = df.sort_values("fetched_at").drop_duplicates(subset=["fetched_at", "promo_price"])
-    if len(df) < 3:
+    # Unique (timestamp, price) pairs ordered by timestamp, via one np.unique on packed int64 rows
+    t = df["fetched_at"].to_numpy("datetime64[ns]").view("i8")
+    p = df["promo_price"].to_numpy("f8")
+    _, idx = np.unique(np.stack([t, p.view("i8")], axis=1), axis=0, return_index=True)
+    if len(idx) < 3:
         return None
 
-    x = (df["fetched_at"] - df["fetched_at"].min()).dt.total_seconds() / 86400
-    y = df["promo_price"].values
+    t, y = t[idx], p[idx]
+    x = (t - t.min()) / 86_400_000_000_000
 
-    coeffs = np.polyfit(x, y, deg=min(deg, len(df) - 1))
-    poly   = np.poly1d(coeffs)
+    # Least squares on the Vandermonde matrix — a tiny (deg+1)-column solve.
+    # Each x-vector gets one Vandermonde, reused for fit, forecast and slope.
+    deg    = min(deg, len(y) - 1)
+    V_hist = np.vander(x, deg + 1)
+    coeffs = np.linalg.lstsq(V_hist, y, rcond=None)[0]
 
     # Residuals → std for confidence interval
-    residuals = y - poly(x)
+    residuals = y - V_hist @ coeffs
     std = residuals.std()
 
     # Future dates
     last_day    = x.max()
     future_days = np.linspace(last_day + 1, last_day + horizon_days, horizon_days)
-    future_pred = poly(future_days)
+    V_future    = np.vander(future_days, deg + 1)
+    future_pred = V_future @ coeffs
 
     last_date   = df["fetched_at"].max()
     future_dates = pd.date_range(last_date + pd.Timedelta(days=1), periods=horizon_days)
 
-    # Trend direction from derivative at last point
-    slope = np.polyder(poly)(last_day)
+    # Trend direction from derivative at last point: the last Vandermonde row
+    # (minus its highest power) holds last_day^(deg-1) … 1 for the derivative coefficients
+    dcoeffs = coeffs[:-1] * np.arange(deg, 0, -1)
+    slope   = V_hist[-1, 1:] @ dcoeffs
     if slope < -0.05:
         trend = "falling"
     elif slope > 0.05:
@@ -75,20 +122,34 @@ def deal_probability(df: pd.DataFrame) -> pd.DataFrame:
 
     Returns a pivot table: rows=hour, cols=day_of_week, values=probability.
     """
-    df = df.copy()
-    df["is_good"] = df["action"].isin(
-        ["SUPER", "GOOD DEAL", "BIG DISCOUNT", "VERY CHEAP", "CHEAP UPPER MID"]
-    ).astype(int)
-
-    agg = (
-        df.groupby(["day_of_week", "hour"])["is_good"]
-        .agg(["sum", "count"])
-        .reset_index()
-    )
-    agg["probability"] = agg["sum"] / agg["count"].clip(lower=1)
-
-    pivot = agg.pivot(index="hour", columns="day_of_week", values="probability")
-    pivot.columns = ["Sun", "Mon", "Tue", "Wed", "Thu", "Fri", "Sat"]
+    dow  = df["day_of_week"].to_numpy(np.int64)
+    hour = df["hour"].to_numpy(np.int64)
+    # Reuse the mask engineer_features already stashed, if present
+    if "is_good_deal" in df.columns:
+        good = df["is_good_deal"].to_numpy(bool)
+    else:
+        good = good_action_mask(df["action"])
+
+    # Dense 7×24 histogram over the flattened (day, hour) bin
+    idx    = dow * 24 + hour
+    sums   = np.bincount(idx, weights=good, minlength=168)
+    counts = np.bincount(idx, minlength=168)
+    with np.errstate(invalid="ignore", divide="ignore"):
+        prob = np.where(counts > 0, sums / counts, np.nan).reshape(7, 24).T
+
+    pivot = pd.DataFrame(prob, index=pd.RangeIndex(24, name="hour"), columns=DAY_NAMES)
+    pivot = pivot.dropna(how="all")
+    return pivot
+
+
+def deal_probability_from_heatmap(agg_df: pd.DataFrame) -> pd.DataFrame:
+    """
+    Same pivot as deal_probability, built from the server-side aggregate
+    returned by queries.load_deal_heatmap (one row per day_of_week × hour).
+    """
+    pivot = agg_df.pivot(index="hour", columns="day_of_week", values="deal_rate")
+    pivot = pivot.sort_index().reindex(columns=range(7)).rename(columns=dict(enumerate(DAY_NAMES)))
+    pivot.columns.name = None
     return pivot
 
 
@@ -96,6 +157,7 @@ def deal_probability(df: pd.DataFrame) -> pd.DataFrame:
 # Price drop probability — P(price drops below threshold within N days)
 # ---------------------------------------------------------------------------
 
+@_memoize_slice()
 def price_drop_probability(df: pd.DataFrame, target_price: float) -> dict:
     """
     Estimate probability that promo_price will drop to or below target_price.
@@ -108,10 +170,10 @@ def price_drop_probability(df: pd.DataFrame, target_price: float) -> dict:
     pct_below = float((prices <= target_price).mean())
     hist_min  = float(prices.min())
 
-    # Fit normal distribution and use CDF
+    # Fit normal distribution and use its CDF: Φ(z) = erfc(-z/√2) / 2
     mu, sigma = prices.mean(), prices.std()
     if sigma > 0:
-        prob = float(stats.norm.cdf(target_price, loc=mu, scale=sigma))
+        prob = 0.5 * erfc(-(target_price - mu) / (sigma * sqrt(2)))
     else:
         prob = 1.0 if target_price >= mu else 0.0
 
@@ -135,39 +197,55 @@ def price_drop_timing(df: pd.DataFrame):
 
     Returns (drop_rate_pivot, avg_drop_pivot) — both indexed by hour, columned by day name.
     """
-    d = df.sort_values(["product_id", "size", "color", "fetched_at"]).copy()
-    d["prev_price"] = d.groupby(["product_id", "size", "color"])["promo_price"].shift(1)
+    # Single int64 key per (product_id, size, color) instead of a 3-column tuple hash
+    p, _ = pd.factorize(df["product_id"])
+    s, _ = pd.factorize(df["size"])
+    c, _ = pd.factorize(df["color"])
+    n_s, n_c = s.max(initial=0) + 1, c.max(initial=0) + 1
+    key = p.astype(np.int64) * (n_s * n_c) + s * n_c + c
+    key[(p < 0) | (s < 0) | (c < 0)] = -1
+
+    order = np.lexsort((df["fetched_at"].to_numpy(), key))
+    key   = key[order]
+    d     = df.iloc[order]
+    price = d["promo_price"].to_numpy(np.float64)
+
+    # Rows are contiguous per key — a run starts wherever the key changes
+    first_in_run = np.ones(len(d), dtype=bool)
+    first_in_run[1:] = np.diff(key) != 0
+    first_in_run |= key < 0
+
+    prev = np.empty_like(price)
+    prev[:1] = np.nan
+    prev[1:] = price[:-1]
+    prev[first_in_run] = np.nan
 
     # Only rows where a previous price exists
-    d = d[d["prev_price"].notna()].copy()
-    d["price_dropped"] = (d["promo_price"] < d["prev_price"]).astype(int)
-    d["drop_pct"] = np.where(
-        d["price_dropped"] == 1,
-        (d["prev_price"] - d["promo_price"]) / d["prev_price"] * 100,
-        np.nan,
-    )
-
-    agg = (
-        d.groupby(["day_of_week", "hour"])
-        .agg(
-            drops=("price_dropped", "sum"),
-            total=("price_dropped", "count"),
-            avg_drop_pct=("drop_pct", "mean"),
-        )
-        .reset_index()
-    )
-    agg["drop_rate"] = agg["drops"] / agg["total"].clip(lower=1)
-
-    day_map = {0: "Sun", 1: "Mon", 2: "Tue", 3: "Wed", 4: "Thu", 5: "Fri", 6: "Sat"}
-    agg["day_name"] = agg["day_of_week"].map(day_map)
-
-    col_order = ["Sun", "Mon", "Tue", "Wed", "Thu", "Fri", "Sat"]
-
-    rate_pivot = agg.pivot(index="hour", columns="day_name", values="drop_rate")
-    avg_pivot  = agg.pivot(index="hour", columns="day_name", values="avg_drop_pct")
-
-    rate_pivot = rate_pivot.reindex(columns=[c for c in col_order if c in rate_pivot.columns]).fillna(0)
-    avg_pivot  = avg_pivot.reindex(columns=[c for c in col_order if c in avg_pivot.columns]).fillna(0)
+    has_prev = ~np.isnan(prev)
+    price, prev = price[has_prev], prev[has_prev]
+    dropped  = price < prev
+    drop_pct = np.where(dropped, (prev - price) / prev * 100, 0.0)
+
+    dow  = d["day_of_week"].to_numpy(np.int64)[has_prev]
+    hour = d["hour"].to_numpy(np.int64)[has_prev]
+    idx  = dow * 24 + hour
+
+    total     = np.bincount(idx, minlength=168).reshape(7, 24).T
+    drops     = np.bincount(idx, weights=dropped, minlength=168).reshape(7, 24).T
+    pct_total = np.bincount(idx, weights=drop_pct, minlength=168).reshape(7, 24).T
+
+    with np.errstate(invalid="ignore", divide="ignore"):
+        drop_rate = drops / np.maximum(total, 1)
+        avg_drop  = np.where(drops > 0, pct_total / drops, 0.0)
+
+    # Keep only the hours / days that were actually observed
+    rows = np.flatnonzero(total.any(axis=1))
+    cols = np.flatnonzero(total.any(axis=0))
+    index   = pd.Index(rows, name="hour")
+    columns = pd.Index(np.asarray(DAY_NAMES)[cols], name="day_name")
+
+    rate_pivot = pd.DataFrame(drop_rate[np.ix_(rows, cols)], index=index, columns=columns)
+    avg_pivot  = pd.DataFrame(avg_drop[np.ix_(rows, cols)], index=index, columns=columns)
 
     return rate_pivot, avg_pivot
 
@@ -178,10 +256,10 @@ def price_drop_timing(df: pd.DataFrame):
 
 def best_time_to_buy(deal_prob_pivot: pd.DataFrame) -> dict:
     """Return the (day, hour) with highest deal probability."""
-    stacked = deal_prob_pivot.stack()
-    best_idx = stacked.idxmax()
+    vals = deal_prob_pivot.to_numpy(dtype=float)
+    i, j = np.unravel_index(np.nanargmax(vals), vals.shape)
     return {
-        "best_hour":        int(best_idx[0]),
-        "best_day":         best_idx[1],
-        "probability":      round(float(stacked.max()), 3),
+        "best_hour":        int(deal_prob_pivot.index[i]),
+        "best_day":         deal_prob_pivot.columns[j],
+        "probability":      round(float(vals[i, j]), 3),
     }
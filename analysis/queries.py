@@ -1,20 +1,90 @@
+import functools
+import io
 import os
 import pandas as pd
-from sqlalchemy import create_engine, text
+from sqlalchemy import bindparam, create_engine, text
+from sqlalchemy.dialects import postgresql
 from dotenv import load_dotenv
 
+try:
+    import connectorx as cx
+except ImportError:  # optional — falls back to pd.read_sql
+    cx = None
+
+try:
+    import pyarrow as pa
+    import pyarrow.csv as pa_csv
+except ImportError:  # optional — COPY output is parsed with pd.read_csv instead
+    pa_csv = None
+
+from ._constants import GOOD_ACTIONS
+
 load_dotenv()
 
 # ---------------------------------------------------------------------------
 # Connection
 # ---------------------------------------------------------------------------
 
+@functools.lru_cache(maxsize=1)
 def get_engine():
+    """Process-wide pooled engine — repeated calls reuse open TLS connections."""
     url = (
         f"postgresql://{os.getenv('DB_USER')}:{os.getenv('DB_PASSWORD')}"
         f"@{os.getenv('DB_HOST')}:{os.getenv('DB_PORT', '5432')}/{os.getenv('DB_NAME', 'postgres')}"
     )
-    return create_engine(url, connect_args={"sslmode": "require"})
+    return create_engine(
+        url,
+        connect_args={"sslmode": "require"},
+        pool_size=8,
+        max_overflow=4,
+        pool_pre_ping=True,
+        pool_recycle=1800,
+    )
+
+
+def _bind(sql: str, params: dict):
+    """text() with bound values; lists are bound as expanding IN parameters."""
+    return text(sql).bindparams(*(
+        bindparam(name, value=value, expanding=isinstance(value, list))
+        for name, value in params.items()
+    ))
+
+
+# The driver dialects use the pyformat paramstyle and would render every literal '%' as '%%';
+# COPY and connectorx take the SQL verbatim, so render with a paramstyle that leaves '%' alone
+_LITERAL_DIALECT = postgresql.dialect(paramstyle="named")
+
+
+def _literal_sql(stmt) -> str:
+    """Render a bound statement as plain SQL with escaped literal values."""
+    return str(stmt.compile(dialect=_LITERAL_DIALECT, compile_kwargs={"literal_binds": True}))
+
+
+def _copy_to_frame(engine, sql: str, str_columns: tuple = ()) -> pd.DataFrame:
+    """Stream `COPY (sql) TO STDOUT` through the raw DB-API connection and parse it in bulk."""
+    copy_sql = f"COPY ({sql}) TO STDOUT WITH (FORMAT CSV, HEADER)"
+    buf = io.BytesIO()
+    conn = engine.raw_connection()
+    try:
+        with conn.cursor() as cur:
+            if hasattr(cur, "copy_expert"):  # psycopg2
+                cur.copy_expert(copy_sql, buf)
+            else:  # psycopg 3, SQLAlchemy's default driver for postgresql:// URLs
+                with cur.copy(copy_sql) as copy:
+                    for data in copy:
+                        buf.write(data)
+    finally:
+        conn.close()
+    buf.seek(0)
+    # Keep code-like columns as text so e.g. color '09' doesn't become 9
+    if pa_csv is not None:
+        convert = pa_csv.ConvertOptions(column_types={c: pa.string() for c in str_columns})
+        return pa_csv.read_csv(buf, convert_options=convert).to_pandas(date_as_object=False)
+    return pd.read_csv(buf, dtype={c: str for c in str_columns})
+
+
+def _size_list(size) -> list:
+    return list(size) if isinstance(size, (list, tuple)) else [size]
 
 
 # ---------------------------------------------------------------------------
@@ -49,33 +119,62 @@ JOIN parent p             ON pv.parent_id = p.id
 ORDER BY tv.fetched_at
 """
 
-GOOD_ACTIONS = ("SUPER", "GOOD DEAL", "BIG DISCOUNT", "VERY CHEAP", "CHEAP UPPER MID")
+# SQL literal for `tv.action IN (...)` — sorted so the rendered query is stable
+GOOD_ACTIONS_SQL = str(tuple(sorted(GOOD_ACTIONS)))
+
+CATEGORICAL_COLUMNS = ("action", "size", "color", "gender")
+TEXT_COLUMNS = CATEGORICAL_COLUMNS + ("name", "product_id")
 
 
 def load_timeseries(engine, size: str = None, gender: str = None,
-                    actions: tuple = None, days: int = None) -> pd.DataFrame:
-    """Load full timeseries with optional filters."""
+                    actions: tuple = None, days: int = None, fast: bool = False) -> pd.DataFrame:
+    """
+    Load full timeseries with optional filters.
+
+    fast=True pulls the result with Postgres COPY (bulk CSV stream) instead of
+    row-by-row cursor decoding — worth it for full-history dashboard loads.
+    """
     conditions = ["pv.size IS NOT NULL", "pv.size != ''"]
+    params = {}
     if size:
-        if isinstance(size, (list, tuple)):
-            quoted = ", ".join(f"'{s}'" for s in size)
-            conditions.append(f"pv.size IN ({quoted})")
-        else:
-            conditions.append(f"pv.size = '{size}'")
+        conditions.append("pv.size IN :sizes")
+        params["sizes"] = _size_list(size)
     if gender:
-        conditions.append(f"p.gender = '{gender}'")
+        conditions.append("p.gender = :gender")
+        params["gender"] = gender
     if actions:
-        quoted = ", ".join(f"'{a}'" for a in actions)
-        conditions.append(f"tv.action IN ({quoted})")
+        conditions.append("tv.action IN :actions")
+        params["actions"] = list(actions)
     if days:
-        conditions.append(f"tv.fetched_at >= NOW() - INTERVAL '{days} days'")
+        conditions.append("tv.fetched_at >= NOW() - make_interval(days => :days)")
+        params["days"] = int(days)
 
     where = ("WHERE " + " AND ".join(conditions)) if conditions else ""
-    sql = TIMESERIES_SQL.format(where=where)
+    stmt = _bind(TIMESERIES_SQL.format(where=where), params)
 
-    df = pd.read_sql(text(sql), engine)
-    df["fetched_at"] = pd.to_datetime(df["fetched_at"])
-    df["date"] = pd.to_datetime(df["date"])
+    df = None
+    if fast:
+        # COPY can't take bind parameters, so the values are rendered as escaped literals
+        try:
+            df = _copy_to_frame(engine, _literal_sql(stmt), TEXT_COLUMNS)
+        except Exception as e:
+            print(f"⚠️ COPY load failed, falling back to pd.read_sql: {e}")
+        else:
+            df["fetched_at"] = pd.to_datetime(df["fetched_at"], format="ISO8601")
+            df["date"] = pd.to_datetime(df["date"])
+    elif cx is not None:
+        # Binary-protocol Arrow ingest; timestamps already arrive as datetime64.
+        # connectorx takes plain SQL, so render the bound values as escaped literals.
+        sql = _literal_sql(stmt)
+        url = engine.url.render_as_string(hide_password=False) + "?sslmode=require"
+        df = cx.read_sql(url, sql, return_type="pandas", protocol="binary")
+    if df is None:
+        df = pd.read_sql(stmt, engine)
+        df["fetched_at"] = pd.to_datetime(df["fetched_at"])
+        df["date"] = pd.to_datetime(df["date"])
+    # Low-cardinality strings → int codes for cheap isin / groupby downstream
+    for col in CATEGORICAL_COLUMNS:
+        df[col] = df[col].astype("category")
     return df
 
 
@@ -127,20 +226,16 @@ ORDER BY 1, 2
 """
 
 def load_deal_heatmap(engine, size: str = None) -> pd.DataFrame:
-    good = str(GOOD_ACTIONS).replace("'", "'").replace("(", "(").replace(")", ")")
+    params = {}
+    where = ""
     if size:
-        if isinstance(size, (list, tuple)):
-            quoted = ", ".join(f"'{s}'" for s in size)
-            where = f"WHERE pv.size IN ({quoted})"
-        else:
-            where = f"WHERE pv.size = '{size}'"
-    else:
-        where = ""
+        where = "WHERE pv.size IN :sizes"
+        params["sizes"] = _size_list(size)
     sql = HEATMAP_SQL.format(
-        good_actions=str(GOOD_ACTIONS),
+        good_actions=GOOD_ACTIONS_SQL,
         where=where
     )
-    df = pd.read_sql(text(sql), engine)
+    df = pd.read_sql(_bind(sql, params), engine)
     df["deal_rate"] = df["good_deals"] / df["total_obs"].clip(lower=1)
     return df
 
@@ -167,7 +262,7 @@ ORDER BY 1, 2, 3
 """
 
 def load_seasonal(engine) -> pd.DataFrame:
-    sql = SEASONAL_SQL.format(good_actions=str(GOOD_ACTIONS))
+    sql = SEASONAL_SQL.format(good_actions=GOOD_ACTIONS_SQL)
     return pd.read_sql(text(sql), engine)
 
 
@@ -197,5 +292,5 @@ LIMIT 50
 """
 
 def load_top_products(engine) -> pd.DataFrame:
-    sql = TOP_PRODUCTS_SQL.format(good_actions=str(GOOD_ACTIONS))
+    sql = TOP_PRODUCTS_SQL.format(good_actions=GOOD_ACTIONS_SQL)
     return pd.read_sql(text(sql), engine)
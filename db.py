@@ -1,6 +1,8 @@
 import os
 import json
 import argparse
+from concurrent.futures import ThreadPoolExecutor
+import numpy as np
 import pandas as pd
 from pathlib import Path
 from dotenv import load_dotenv
@@ -11,6 +13,9 @@ load_dotenv()
 SUPABASE_URL = os.getenv("SUPABASE_URL")
 SUPABASE_KEY = os.getenv("SUPABASE_KEY")
 
+UPSERT_CHUNK_SIZE = 2000
+UPSERT_WORKERS = 4
+
 # ---------------------------------------------------------------------------
 # Client
 # ---------------------------------------------------------------------------
@@ -21,33 +26,61 @@ def get_client():
     return create_client(SUPABASE_URL, SUPABASE_KEY)
 
 
+def _chunks(lst: list, n: int):
+    for i in range(0, len(lst), n):
+        yield lst[i:i + n]
+
+
+def _upsert_batched(client, table: str, rows: list) -> list:
+    """Upsert rows in bounded chunks, issuing the requests concurrently on one client."""
+    with ThreadPoolExecutor(max_workers=UPSERT_WORKERS) as ex:
+        return list(ex.map(
+            lambda chunk: client.table(table).upsert(chunk).execute(),
+            _chunks(rows, UPSERT_CHUNK_SIZE),
+        ))
+
+
 # ---------------------------------------------------------------------------
 # products
 # ---------------------------------------------------------------------------
 
+PRODUCT_COLUMNS = {
+    "Product ID":     "id",
+    "Product Name":   "name",
+    "Promo Price":    "promo_price",
+    "Original Price": "orig_price",
+    "Discount %":     "discount_pct",
+    "Rating":         "rating",
+    "Reviews":        "reviews",
+    "Review_Score":   "review_score",
+    "Action":         "action",
+    "Product URL":    "product_url",
+    "Fetched At":     "fetched_at",
+}
+
+NUMERIC_COLUMNS = ("Promo Price", "Original Price", "Discount %", "Rating", "Review_Score")
+
+
+def _to_records(df: pd.DataFrame) -> list:
+    """DataFrame → list of dicts with NaN/NA replaced by None (JSON-safe)."""
+    return df.astype(object).where(df.notna(), None).to_dict(orient="records")
+
+
 def upsert_products(csv_path: str, country: str):
     """Load filtered-uniqlo-products.csv (or uniqlo-with-sizes.csv) and upsert into products table."""
-    df = pd.read_csv(csv_path)
+    df = pd.read_csv(csv_path).reindex(columns=list(PRODUCT_COLUMNS))
     client = get_client()
 
-    rows = []
-    for _, row in df.iterrows():
-        rows.append({
-            "id":           str(row["Product ID"]),
-            "country":      country,
-            "name":         row.get("Product Name"),
-            "promo_price":  float(row["Promo Price"])  if pd.notna(row.get("Promo Price"))  else None,
-            "orig_price":   float(row["Original Price"]) if pd.notna(row.get("Original Price")) else None,
-            "discount_pct": float(row["Discount %"])   if pd.notna(row.get("Discount %"))   else None,
-            "rating":       float(row["Rating"])        if pd.notna(row.get("Rating"))        else None,
-            "reviews":      int(float(row["Reviews"]))  if pd.notna(row.get("Reviews"))       else None,
-            "review_score": float(row["Review_Score"])  if pd.notna(row.get("Review_Score"))  else None,
-            "action":       row.get("Action"),
-            "product_url":  row.get("Product URL"),
-            "fetched_at":   row.get("Fetched At"),
-        })
-
-    result = client.table("products").upsert(rows).execute()
+    for col in NUMERIC_COLUMNS:
+        df[col] = pd.to_numeric(df[col], errors="coerce").astype(float)
+    df["Reviews"] = np.trunc(pd.to_numeric(df["Reviews"], errors="coerce")).astype("Int64")
+    df["Product ID"] = df["Product ID"].astype(str)
+
+    df = df.rename(columns=PRODUCT_COLUMNS)
+    df.insert(1, "country", country)
+    rows = _to_records(df)
+
+    result = _upsert_batched(client, "products", rows)
     print(f"[products] Upserted {len(rows)} rows for country={country}")
     return result
 
@@ -56,25 +89,33 @@ def upsert_products(csv_path: str, country: str):
 # product_sizes
 # ---------------------------------------------------------------------------
 
-def _parse_sizes_str(sizes_str: str):
-    """Parse 'COLOR_CODE-NAME: S, M, L | ...' into list of dicts."""
-    variants = []
-    if not sizes_str or str(sizes_str).strip().lower() == "unavailable":
-        return variants
-    for variant in str(sizes_str).split("|"):
-        variant = variant.strip()
-        if not variant or ":" not in variant:
-            continue
-        color_part, sizes_part = variant.split(":", 1)
-        color_part = color_part.strip()
-        # color_part format: '0069-DUNKELBLAU'
-        if "-" in color_part:
-            code, name = color_part.split("-", 1)
-        else:
-            code, name = color_part, color_part
-        sizes = [s.strip() for s in sizes_part.split(",") if s.strip()]
-        variants.append({"color_code": code, "color_name": name, "sizes": sizes})
-    return variants
+# One stripped, non-empty size token between commas
+_SIZE_TOKEN_RE = r"[^,\s](?:[^,]*[^,\s])?"
+
+
+def _explode_sizes(df: pd.DataFrame) -> pd.DataFrame:
+    """Parse 'COLOR_CODE-NAME: S, M, L | ...' into one row per color variant."""
+    s = df[["Product ID", "Fetched At", "Available Sizes"]].dropna(subset=["Available Sizes"])
+    sizes_str = s["Available Sizes"].astype(str)
+    s = s[sizes_str.str.strip().str.lower() != "unavailable"]
+
+    v = s.assign(variant=s["Available Sizes"].astype(str).str.split("|")).explode("variant")
+    # Split on the first ':' only; variants without one are skipped
+    parts = v["variant"].str.strip().str.extract(r"^([^:]*):(.*)$")
+    keep = parts[0].notna()
+    v, parts = v[keep], parts[keep]
+
+    # color_part format: '0069-DUNKELBLAU' (no dash → code and name are the same)
+    color = parts[0].str.strip()
+    code_name = color.str.extract(r"^([^-]*)(?:-(.*))?$")
+
+    return pd.DataFrame({
+        "product_id": v["Product ID"].astype(str),
+        "color_code": code_name[0],
+        "color_name": code_name[1].fillna(code_name[0]),
+        "sizes":      parts[1].str.findall(_SIZE_TOKEN_RE),
+        "fetched_at": v["Fetched At"],
+    })
 
 
 def upsert_product_sizes(csv_path: str, country: str):
@@ -82,21 +123,11 @@ def upsert_product_sizes(csv_path: str, country: str):
     df = pd.read_csv(csv_path)
     client = get_client()
 
-    rows = []
-    for _, row in df.iterrows():
-        pid = str(row["Product ID"])
-        fetched_at = row.get("Fetched At")
-        for variant in _parse_sizes_str(row.get("Available Sizes", "")):
-            rows.append({
-                "product_id": pid,
-                "country":    country,
-                "color_code": variant["color_code"],
-                "color_name": variant["color_name"],
-                "sizes":      variant["sizes"],
-                "fetched_at": fetched_at,
-            })
+    variants = _explode_sizes(df)
+    variants.insert(1, "country", country)
+    rows = _to_records(variants)
 
-    result = client.table("product_sizes").upsert(rows).execute()
+    result = _upsert_batched(client, "product_sizes", rows)
     print(f"[product_sizes] Upserted {len(rows)} color variants for country={country}")
     return result
 
@@ -127,7 +158,7 @@ def sync_blocked_products(json_path: str, country: str = None):
                 "blocked_colors": rule,
             })
 
-    result = client.table("blocked_products").upsert(rows).execute()
+    result = _upsert_batched(client, "blocked_products", rows)
     print(f"[blocked_products] Synced {len(rows)} entries")
     return result
 
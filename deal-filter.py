@@ -1,12 +1,10 @@
 import pandas as pd
 import numpy as np
-import re
 from pathlib import Path
 from datetime import datetime
-import json
 import argparse
 
-from utils import load_country_config, save_or_append_df
+from utils import RAW_HISTORY_COLUMNS, append_history, load_blocked_config, load_country_config, read_csv
 
 # Paths
 CSV_PATH = 'product-ids/uniqlo-products.csv'
@@ -24,33 +22,44 @@ TARGET_IDS_FILE = f'product-ids/target-ids-{args.country}.txt'
 print(f"Country: {args.country.upper()} | Filter mode: {config['filter_mode']}")
 
 # Load and clean product data
-df = pd.read_csv(CSV_PATH)
-
-def clean_price(price_str):
-    if pd.isna(price_str):
-        return None
-    price_str = price_str.replace('€', '').replace(',', '.').strip()
-    match = re.findall(r'\d+\.?\d*', price_str)
-    return float(match[0]) if match else None
-
-df['Promo Price'] = df['Price (Promo)'].apply(clean_price)
-df['Original Price'] = df['Price (Original)'].apply(clean_price)
-df['Discount %'] = ((df['Original Price'] - df['Promo Price']) / df['Original Price']) * 100
-df['Discount %'] = df['Discount %'].round(2)
-
-df['Reviews'] = df['Reviews'].replace('', pd.NA).fillna(0)
-df['Rating'] = df['Rating'].replace('', pd.NA).fillna(0)
-
-df['Reviews'] = df['Reviews'].replace('[^0-9]', '', regex=True).astype(float)
-df['Rating'] = pd.to_numeric(df['Rating'], errors='coerce')
+df = read_csv(CSV_PATH, str_columns=('Fetched At',))
+
+def clean_price_series(s):
+    """'19,90 €' → 19.9 for a whole column; unparseable values become NaN."""
+    number = (
+        s.astype('string')
+        .str.replace('€', '', regex=False)
+        .str.replace(',', '.', regex=False)
+        .str.extract(r'(\d+\.?\d*)', expand=False)
+    )
+    return pd.to_numeric(number, errors='coerce').astype(float)
+
+promo = clean_price_series(df['Price (Promo)'])
+original = clean_price_series(df['Price (Original)'])
+df = df.assign(**{
+    'Promo Price': promo,
+    'Original Price': original,
+    'Discount %': ((original - promo) / original * 100).round(2),
+})
+
+# Blank reviews/rating mean "none yet" → 0; anything else that doesn't parse is dropped below
+blank_reviews = df['Reviews'].isna() | df['Reviews'].eq('')
+blank_rating = df['Rating'].isna() | df['Rating'].eq('')
+
+# Keep only the digits of text counts ('1.234' → 1234); numeric columns pass straight through
+reviews = df['Reviews']
+if not pd.api.types.is_numeric_dtype(reviews):
+    reviews = reviews.astype('string').str.replace(r'[^0-9]', '', regex=True)
+df['Reviews'] = pd.to_numeric(reviews, errors='coerce').astype(float).mask(blank_reviews, 0)
+df['Rating'] = pd.to_numeric(df['Rating'], errors='coerce').mask(blank_rating, 0)
 df.dropna(subset=['Reviews', 'Rating', 'Discount %'], inplace=True)
 
-# Smart review score (rating x log scale reviews)
-df['Review_Score'] = df['Rating'] * np.log10(df['Reviews'] + 1)
-df['Review_Score'] = df['Review_Score'].round(2)
-# Quantiles (rounded to 1 digit)
-df['Review_Score_Quantile'] = df['Review_Score'].rank(pct=True).round(2)
-df['Discount_Quantile'] = df['Discount %'].rank(pct=True).round(2)
+# Smart review score (rating x log scale reviews) and quantiles (rounded to 2 digits)
+df = df.assign(
+    Review_Score=lambda d: (d['Rating'] * np.log10(d['Reviews'] + 1)).round(2),
+    Review_Score_Quantile=lambda d: d['Review_Score'].rank(pct=True).round(2),
+    Discount_Quantile=lambda d: d['Discount %'].rank(pct=True).round(2),
+)
 
 # Extract and format the unique timestamp from the 'Fetched At' column
 try:
@@ -62,61 +71,59 @@ except Exception as e:
     title_with_time = 'UNIQLO Product Insights'
     print(f"Could not format 'Fetched At' timestamp: {e}")
 
-# Categorize products
-def classify_action(row):
-    r_q = row['Review_Score_Quantile']
-    d_q = row['Discount_Quantile']
-    discount = row['Discount %']
-    price = row['Promo Price']
-
-    if r_q >= 0.9 and d_q >= 0.80:
-        return 'SUPER'
-    elif r_q >= 0.9 and 0.5 <= d_q < 0.80:
-        return 'WAIT FOR SALE'
-    elif r_q >= 0.80 and d_q >= 0.80:
-        return 'GOOD DEAL'
-    elif r_q >= 0.80 and 0.4 <= d_q < 0.80:
-        return 'DECENT'
-    elif 0.7 <= r_q < 0.8 and d_q >= 0.8:
-        return 'CHEAP UPPER MID'
-    elif r_q < 0.5 and d_q >= 0.9:
-        return 'CHEAP BUT MID'
-    elif discount >= 76:
-        return 'BIG DISCOUNT'
-    elif price is not None and price <= 5:
-        return 'VERY CHEAP'
-    elif r_q < 0.3 and d_q < 0.3:
-        return 'AVOID'
-    else:
-        return 'NEUTRAL'
-
-df['Action'] = df.apply(classify_action, axis=1)
+# Categorize products — conditions are checked in order, first match wins
+ACTION_LABELS = [
+    'SUPER',
+    'WAIT FOR SALE',
+    'GOOD DEAL',
+    'DECENT',
+    'CHEAP UPPER MID',
+    'CHEAP BUT MID',
+    'BIG DISCOUNT',
+    'VERY CHEAP',
+    'AVOID',
+    'NEUTRAL',  # default when no condition matches
+]
+
+def classify_actions(df):
+    r_q = df['Review_Score_Quantile'].to_numpy()
+    d_q = df['Discount_Quantile'].to_numpy()
+    discount = df['Discount %'].to_numpy()
+    price = df['Promo Price'].to_numpy(dtype=float)
+
+    conditions = [
+        (r_q >= 0.9) & (d_q >= 0.80),
+        (r_q >= 0.9) & (0.5 <= d_q) & (d_q < 0.80),
+        (r_q >= 0.80) & (d_q >= 0.80),
+        (r_q >= 0.80) & (0.4 <= d_q) & (d_q < 0.80),
+        (0.7 <= r_q) & (r_q < 0.8) & (d_q >= 0.8),
+        (r_q < 0.5) & (d_q >= 0.9),
+        discount >= 76,
+        price <= 5,
+        (r_q < 0.3) & (d_q < 0.3),
+    ]
+    codes = np.select(conditions, np.arange(len(conditions), dtype=np.int8), default=len(conditions))
+    return pd.Categorical.from_codes(codes, categories=ACTION_LABELS)
+
+df['Action'] = classify_actions(df)
+df['Product ID'] = df['Product ID'].astype('category')
+# Text form of the IDs, computed once and reused by every ID filter below
+pid_str = df['Product ID'].astype(str)
+has_pid = df['Product ID'].notna()
 
 # Select products based on filter_mode from config
 selected_actions = {'SUPER', 'GOOD DEAL', 'CHEAP UPPER MID', 'BIG DISCOUNT'}
 
 if config['filter_mode'] == 'all':
-    filtered_ids = (
-        df['Product ID']
-        .dropna()
-        .astype(str)
-        .tolist()
-    )
+    filtered_ids = pid_str[has_pid].tolist()
 else:
-    filtered_ids = (
-        df[df['Action'].isin(selected_actions)]['Product ID']
-        .dropna()
-        .astype(str)
-        .tolist()
-    )
+    filtered_ids = pid_str[has_pid & df['Action'].isin(selected_actions)].tolist()
 
 # Load block list
-blocked_ids = {}
-if Path(BLOCK_PATH).exists():
-    with open(BLOCK_PATH, 'r') as f:
-        blocked_ids = json.load(f)
+blocked_ids = load_blocked_config(BLOCK_PATH)
 print(blocked_ids)
-filtered_ids = [pid for pid in filtered_ids if blocked_ids.get(pid) is not True]
+fully_blocked = frozenset(pid for pid, rule in blocked_ids.items() if rule is True)
+filtered_ids = [pid for pid in filtered_ids if pid not in fully_blocked]
 
 # Load existing interested IDs
 existing_ids = set()
@@ -124,11 +131,12 @@ if Path(TARGET_IDS_FILE).exists():
     with open(TARGET_IDS_FILE, 'r') as f:
         existing_ids = set(line.strip() for line in f if line.strip())
 
-# Append new IDs (no duplicates)
-updated_ids = sorted(existing_ids.union(filtered_ids))
-with open(ID_PATH, 'w') as f:
-    for pid in updated_ids:
-        f.write(pid + '\n')
+# Append new IDs (no duplicates), sorted and written in one pass
+updated_ids = np.unique(np.concatenate([
+    np.fromiter(existing_ids, dtype=object, count=len(existing_ids)),
+    np.asarray(filtered_ids, dtype=object),
+]))
+np.savetxt(ID_PATH, updated_ids, fmt='%s')
 
 print(f"Added {len(filtered_ids)} new IDs. Total now: {len(updated_ids)}")
 
@@ -136,21 +144,21 @@ print(f"Added {len(filtered_ids)} new IDs. Total now: {len(updated_ids)}")
 df.to_csv(CSV_PATH, index=False)
 print(f"Updated dataset with metrics saved to {CSV_PATH}")
 
-save_or_append_df(df, 'product-ids/uniqlo-raw-history.csv')
+append_history(df, 'product-ids/uniqlo-raw-history', RAW_HISTORY_COLUMNS)
 
 if config['filter_mode'] == 'all':
     print(existing_ids)
-    filtered_df = df[df['Product ID'].astype(str).isin(existing_ids)]
+    filtered_df = df[pid_str.isin(existing_ids)]
     print(filtered_df)
 else:
-    filtered_df = df[df['Product ID'].astype(str).isin(updated_ids)]
+    filtered_df = df[pid_str.isin(updated_ids)]
 
 columns_to_drop = ['Price (Promo)', 'Price (Original)']
 filtered_df_csv = filtered_df.drop(columns=[col for col in columns_to_drop if col in filtered_df.columns])
 
 # Exclude fully-blocked products so fetch-sizes.js skips them entirely
 filtered_df_csv = filtered_df_csv[
-    ~filtered_df_csv['Product ID'].astype(str).apply(lambda pid: blocked_ids.get(pid) is True)
+    ~pid_str.loc[filtered_df_csv.index].isin(fully_blocked)
 ]
 
 # Save filtered dataset
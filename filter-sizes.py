@@ -1,43 +1,44 @@
+import numpy as np
 import pandas as pd
 import argparse
 import re
 
-from utils import save_or_append_df
+from utils import VERIFIED_HISTORY_COLUMNS, append_history, read_csv
 
 # ✅ Default sizes to keep
 DEFAULT_SIZES = {"XS", "S", "M", "L", "XL", "26INCH", "27INCH", "28INCH", "29INCH", "39-42"}
 
+_WS_RE = re.compile(r'\s+')
+_COLOR_PREFIX_RE = re.compile(r'(?:^|\|)[^|:]*:')  # 'color:' at the start of each variant
+_TOKEN_RE = re.compile(r'[|,]')
+
 def clean_and_extract_sizes(size_str):
     if pd.isna(size_str) or str(size_str).strip().lower() == 'unavailable':
         return set()
 
-    size_str = re.sub(r'\s+', ' ', str(size_str)).strip()  # normalize whitespace
-
-    all_sizes = set()
-    for variant in size_str.split('|'):
-        if ':' in variant:
-            _, sizes_part = variant.split(':', 1)
-        else:
-            sizes_part = variant
-        sizes = [s.strip().upper() for s in sizes_part.split(',') if s.strip()]
-        all_sizes.update(sizes)
-    return all_sizes
+    size_str = _WS_RE.sub(' ', str(size_str)).strip()  # normalize whitespace
+    parts = _TOKEN_RE.split(_COLOR_PREFIX_RE.sub('|', size_str))
+    return {p.strip().upper() for p in parts if p.strip()}
 
-def should_keep(row, wanted_sizes):
-    sizes_ok = not clean_and_extract_sizes(row['Available Sizes']).isdisjoint(wanted_sizes)
-    discount_ok = pd.notna(row['Discount %']) and float(row['Discount %']) >= 35
-    return sizes_ok and discount_ok
+def keep_mask(df, wanted_sizes):
+    """Size/discount check over the whole frame; each distinct sizes string is parsed only once."""
+    # The same size strings repeat across many products, so clean_and_extract_sizes runs on the uniques
+    codes, uniques = pd.factorize(df['Available Sizes'])  # missing → -1
+    unique_ok = [not clean_and_extract_sizes(s).isdisjoint(wanted_sizes) for s in uniques]
+    sizes_ok = pd.Series(np.append(np.array(unique_ok, dtype=bool), False)[codes], index=df.index)
+    discount_ok = pd.to_numeric(df['Discount %'], errors='coerce') >= 35
+    return sizes_ok & discount_ok
 
 
 def main(input_csv, output_csv, wanted_sizes):
-    df = pd.read_csv(input_csv)
+    df = read_csv(input_csv, str_columns=('Fetched At',))
     initial_count = len(df)
 
-    df_filtered = df[df.apply(lambda row: should_keep(row, wanted_sizes), axis=1)]
+    df_filtered = df[keep_mask(df, wanted_sizes)]
     final_count = len(df_filtered)
 
     df_filtered.to_csv(output_csv, index=False)
-    save_or_append_df(df_filtered, 'product-ids/verified-history.csv')
+    append_history(df_filtered, 'product-ids/verified-history', VERIFIED_HISTORY_COLUMNS)
 
     print(f"✅ Kept {final_count} rows (from {initial_count}) based on size and discount ≥ 35%")
     print(f"📁 Saved to: {output_csv}")
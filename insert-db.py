@@ -3,11 +3,11 @@ import re
 import argparse
 import pandas as pd
 from datetime import datetime
-from urllib.parse import urlparse, parse_qs
+from urllib.parse import unquote_plus
 from supabase import create_client
 from dotenv import load_dotenv
 
-from utils import load_country_config
+from utils import load_country_config, read_csv, read_csv_chunks
 
 # Parse arguments
 parser = argparse.ArgumentParser()
@@ -21,105 +21,215 @@ load_dotenv()
 supabase = create_client(os.getenv("SUPABASE_URL"), os.getenv("SUPABASE_KEY"))
 
 # CSV paths
-DF_PRODUCTS = pd.read_csv("product-ids/uniqlo-products.csv")
-DF_SIZES = pd.read_csv("product-ids/uniqlo-with-sizes.csv")
-df = pd.merge(DF_PRODUCTS, DF_SIZES[["Product ID", "Product URL", "Available Sizes"]], on=["Product ID", "Product URL"], how="left")
-df["Available Sizes"] = df["Available Sizes"].fillna("Unknown")
-
-def extract_color_code(url: str) -> str:
-    try:
-        path = urlparse(url).path.rstrip('/').split('/')[-1]
-        color_param = parse_qs(urlparse(url).query).get("colorDisplayCode", [None])[0]
-        return f"{path}{color_param}" if path and color_param else None
-    except:
-        return None
-
-
-def determine_gender(url: str, gender_keywords: dict) -> str:
-    url_lower = url.lower()
-    for gender, keywords in gender_keywords.items():
-        if any(kw in url_lower for kw in keywords):
-            return gender
-    return "unknown"
+PRODUCT_COLUMNS = [
+    "Product ID", "Product Name", "Product URL", "Color Variant URLs",
+    "Promo Price", "Original Price", "Rating", "Reviews", "Discount %", "Action", "Fetched At",
+]
+SIZE_COLUMNS = ["Product ID", "Product URL", "Available Sizes"]
+
+PRODUCTS_CSV = "product-ids/uniqlo-products.csv"
+CHUNK_SIZE = 10_000
+MERGE_KEYS = ["Product ID", "Product URL"]
+
+DF_SIZES = read_csv("product-ids/uniqlo-with-sizes.csv", str_columns=("Product ID",), columns=SIZE_COLUMNS)
+
+
+def merge_sizes(products):
+    """Left-join a products chunk with DF_SIZES; missing sizes become 'Unknown'."""
+    sizes = DF_SIZES.copy()
+    # Shared categorical keys let the merge join on integer codes instead of hashing strings
+    for key in MERGE_KEYS:
+        key_dtype = pd.CategoricalDtype(pd.concat([products[key], sizes[key]]).dropna().unique())
+        products[key] = products[key].astype(key_dtype)
+        sizes[key] = sizes[key].astype(key_dtype)
+    products["Action"] = products["Action"].astype("category")
+
+    df = pd.merge(products, sizes, on=MERGE_KEYS, how="left")
+    df["Available Sizes"] = df["Available Sizes"].fillna("Unknown")
+    return df
+
+
+def extract_color_code(urls: pd.Series) -> pd.Series:
+    """
+    Last path segment + colorDisplayCode param per URL ('.../00?colorDisplayCode=09' → '0009'); NA if either is missing.
+    Matches urlparse/parse_qs for http(s) and scheme-less URLs, including fragments, ';params' and %-escapes.
+    """
+    urls = urls.astype("string")
+    path = (
+        urls.str.replace(r"[?#].*$", "", regex=True)
+        .str.replace(r"^(?:[A-Za-z][A-Za-z0-9+.-]*:)?(?://[^/]*)?", "", regex=True)  # scheme and host
+        .str.replace(r";[^/]*$", "", regex=True)  # ';params' of the last segment, which urlparse splits off
+        .str.rstrip("/")
+        .str.rsplit("/", n=1)
+        .str[-1]
+    )
+    # Query string of the URL without its fragment, so a '?' inside '#...' is not read as a query
+    query = urls.str.replace(r"#.*$", "", regex=True).str.extract(r"\?(.*)", expand=False)
+    color_param = query.str.extract(r"(?:^|&)colorDisplayCode=([^&]+)", expand=False)
+    # Decode '%xx' escapes and '+' like parse_qs, only for the values that contain them
+    encoded = color_param.str.contains(r"[%+]", regex=True, na=False)
+    color_param = color_param.mask(encoded, color_param[encoded].map(unquote_plus))
+    return (path + color_param).where(((path != "") & (color_param != "")).fillna(False))
+
+
+def determine_gender(urls: pd.Series, gender_keywords: dict) -> pd.Series:
+    """First gender (in config order) whose keywords appear in the URL, else 'unknown'."""
+    url_lower = urls.str.lower()
+    gender = pd.Series("unknown", index=urls.index)
+    for g, keywords in gender_keywords.items():
+        if not keywords:
+            continue
+        mask = url_lower.str.contains("|".join(re.escape(kw) for kw in keywords), regex=True)
+        gender = gender.mask(mask & (gender == "unknown"), g)
+    return gender
+
+
+BATCH_SIZE = 500
+PAGE_SIZE = 1000  # PostgREST max-rows on Supabase; larger selects come back truncated
+
+TIMESERIES_COLUMNS = {
+    "Promo Price":    "promo_price",
+    "Original Price": "original_price",
+    "Rating":         "rating",
+    "Reviews":        "reviews",
+    "Discount %":     "discount_percent",
+    "Action":         "action",
+    "Fetched At":     "fetched_at",
+}
+
+
+def _batches(records: list, n: int = BATCH_SIZE):
+    for i in range(0, len(records), n):
+        yield records[i:i + n]
+
+
+def _select_all(build_query):
+    """All rows of a select, fetched in id-ordered pages until a short page comes back."""
+    rows, start = [], 0
+    while True:
+        page = build_query().order("id").range(start, start + PAGE_SIZE - 1).execute().data
+        rows.extend(page)
+        if len(page) < PAGE_SIZE:
+            return rows
+        start += PAGE_SIZE
+
+
+def explode_variants(df):
+    """One row per (product row, color, size), parsed from the 'Available Sizes' blocks."""
+    # First color variant's URL, falling back to the product URL
+    variant_url = (
+        df["Color Variant URLs"].fillna(df["Product URL"].astype(str))
+        .str.split('|', n=1).str[0].str.strip()
+    )
+    color_code = extract_color_code(variant_url)
+
+    sizes_field = df["Available Sizes"].astype(str).str.strip()
+    fallback = color_code.fillna("None") + "-X: "
+    sizes_field = sizes_field.mask(sizes_field.isin(["Unknown", ""]), fallback + "Unknown")
+    sizes_field = sizes_field.mask(sizes_field == "Unavailable", fallback + "Unavailable")
+
+    blocks = sizes_field.str.split('|').explode()
+    parsed = blocks.str.strip().str.extract(r'^(\d{4})-[^:]+:\s*(.+)')
+    for idx, block in blocks[parsed[0].isna()].items():
+        print(f"Failed to parse color block for {df.at[idx, 'Product ID']}: {block}")
+
+    parsed = parsed.dropna().set_axis(["color", "size"], axis=1)
+    parsed["size"] = parsed["size"].str.split(',')
+    parsed = parsed.explode("size")
+    parsed["size"] = parsed["size"].str.strip()
+    parsed = parsed[parsed["size"] != ""]
+    parsed["variant_url"] = variant_url
+    return parsed
+
+
+# Run-wide ID caches shared by all chunks, so each parent/variant costs at most one lookup
+PARENTS = {}      # product_id → {"id", "name", ...} as last read or written
+VARIANT_IDS = {}  # (parent_id, color, size) → variant id
 
 
 def upload_main_data(df):
     gender_keywords = config['gender_keywords']
-
-    for _, row in df.iterrows():
-        product_id = row["Product ID"]
-        name = row["Product Name"]
-        general_url = row["Product URL"]
-        variant_url = row["Color Variant URLs"].split('|')[0].strip() if pd.notna(row["Color Variant URLs"]) else general_url
-        color_code = extract_color_code(variant_url)
-        gender = determine_gender(general_url, gender_keywords)
-
-        sizes_field = str(row.get("Available Sizes", "")).strip()
-        if sizes_field == "Unknown" or not sizes_field:
-            sizes_field = f"{color_code}-X: Unknown"
-
-        if sizes_field == "Unavailable":
-            sizes_field = f"{color_code}-X: Unavailable"
-
-        for block in sizes_field.split('|'):
-            match = re.match(r'(\d{4})-[^:]+:\s*(.+)', block.strip())
-            if not match:
-                print(f"Failed to parse color block for {product_id}: {block}")
-                continue
-
-            color_code, size_str = match.groups()
-            sizes = [s.strip() for s in size_str.split(',') if s.strip()]
-
-            # Insert or update parent
-            parent_resp = supabase.table("parent").select("id", "name").eq("product_id", product_id).execute()
-            if parent_resp.data:
-                parent_id = parent_resp.data[0]["id"]
-                if parent_resp.data[0]["name"] != name:
-                    supabase.table("parent").update({"name": name}).eq("id", parent_id).execute()
-            else:
-                insert = supabase.table("parent").insert({
-                    "product_id": product_id,
-                    "name": name,
-                    "gender": gender,
-                    "general_url": general_url
-                }).execute()
-                parent_id = insert.data[0]["id"]
-
-            for size in sizes:
-                # Insert variant if missing
-                variant_resp = supabase.table("product_variants").select("id").match({
-                            "parent_id": parent_id,
-                            "color": color_code,
-                            "size": size
-                        }).execute()
-                if variant_resp.data:
-                    variant_id = variant_resp.data[0]["id"]
-                else:
-                    insert = supabase.table("product_variants").insert({
-                        "parent_id": parent_id,
-                        "color": color_code,
-                        "size": size,
-                        "variant_url": variant_url
-                    }).execute()
-                    variant_id = insert.data[0]["id"]
-
-                # Insert timeseries
-                try:
-                    supabase.table("timeseries_values").insert({
-                        "variant_id": variant_id,
-                        "promo_price": float(row["Promo Price"]),
-                        "original_price": float(row["Original Price"]),
-                        "rating": float(row["Rating"]),
-                        "reviews": int(float(row["Reviews"])),
-                        "discount_percent": float(row["Discount %"]),
-                        "action": row["Action"],
-                        "fetched_at": pd.to_datetime(row["Fetched At"]).isoformat()
-                    }).execute()
-                except Exception as e:
-                    print(f"Failed timeseries insert for {product_id}: {e}")
-
-
-# Run
-upload_main_data(df)
+    df = df.reset_index(drop=True)
+    variants = explode_variants(df)
+    rows = df.loc[variants.index.unique()]
+
+    # Parents: one upsert per batch. Name follows the latest row; gender and URL the first.
+    parents = rows.groupby("Product ID", sort=False, observed=True).agg(
+        name=("Product Name", "last"),
+        general_url=("Product URL", "first"),
+    )
+    parents["gender"] = determine_gender(parents["general_url"], gender_keywords)
+    parent_records = parents.reset_index().rename(columns={"Product ID": "product_id"})[
+        ["product_id", "name", "gender", "general_url"]
+    ].to_dict("records")
+
+    # Existing parents are looked up once per run; only their name is ever updated
+    unseen = [r["product_id"] for r in parent_records if r["product_id"] not in PARENTS]
+    for batch in _batches(unseen):
+        found = _select_all(lambda: supabase.table("parent").select("id", "product_id", "name").in_("product_id", batch))
+        PARENTS.update({r["product_id"]: r for r in found})
+
+    new_records = [r for r in parent_records if r["product_id"] not in PARENTS]
+    for batch in _batches(new_records):
+        resp = supabase.table("parent").upsert(batch, on_conflict="product_id", ignore_duplicates=True).execute()
+        PARENTS.update({r["product_id"]: r for r in resp.data})
+
+    for record in parent_records:
+        cached = PARENTS[record["product_id"]]
+        if cached["name"] != record["name"]:
+            supabase.table("parent").update({"name": record["name"]}).eq("id", cached["id"]).execute()
+            cached["name"] = record["name"]
+
+    # Variants: insert the ones not seen yet (existing rows keep their URL); inserted rows come back
+    # with their IDs, so only variants that already existed in the table need a select
+    parent_ids = {pid: PARENTS[pid]["id"] for pid in parents.index}
+    # Map plain IDs: mapping the categorical would turn unused categories into NaN and the IDs into floats
+    variants["parent_id"] = df.loc[variants.index, "Product ID"].astype(str).map(parent_ids).to_numpy(dtype="int64")
+    variant_records = [
+        r for r in variants.drop_duplicates(["parent_id", "color", "size"])[
+            ["parent_id", "color", "size", "variant_url"]
+        ].to_dict("records")
+        if (r["parent_id"], r["color"], r["size"]) not in VARIANT_IDS
+    ]
+    for batch in _batches(variant_records):
+        resp = supabase.table("product_variants").upsert(
+            batch, on_conflict="parent_id,color,size", ignore_duplicates=True
+        ).execute()
+        VARIANT_IDS.update({(r["parent_id"], r["color"], r["size"]): r["id"] for r in resp.data})
+
+    missing = list({r["parent_id"] for r in variant_records if (r["parent_id"], r["color"], r["size"]) not in VARIANT_IDS})
+    for batch in _batches(missing):
+        found = _select_all(
+            lambda: supabase.table("product_variants").select("id", "parent_id", "color", "size").in_("parent_id", batch)
+        )
+        VARIANT_IDS.update({(r["parent_id"], r["color"], r["size"]): r["id"] for r in found})
+
+    # Timeseries: one value per exploded variant row, inserted in batches
+    values = rows[list(TIMESERIES_COLUMNS)].rename(columns=TIMESERIES_COLUMNS)
+    for col in ("promo_price", "original_price", "rating", "reviews", "discount_percent"):
+        values[col] = pd.to_numeric(values[col], errors="coerce")
+    values["fetched_at"] = pd.to_datetime(values["fetched_at"], errors="coerce")
+    invalid = values.isna().any(axis=1)
+    for product_id in rows.loc[invalid, "Product ID"].unique():
+        print(f"Failed timeseries insert for {product_id}: missing or non-numeric values")
+    values = values[~invalid]
+    values["reviews"] = values["reviews"].astype(int)
+    values["fetched_at"] = values["fetched_at"].map(pd.Timestamp.isoformat)
+
+    series = variants.join(values, how="inner")
+    series["variant_id"] = [
+        VARIANT_IDS[key] for key in zip(series["parent_id"], series["color"], series["size"])
+    ]
+    timeseries_records = series[["variant_id", *TIMESERIES_COLUMNS.values()]].to_dict("records")
+    for batch in _batches(timeseries_records):
+        try:
+            supabase.table("timeseries_values").insert(batch).execute()
+        except Exception as e:
+            print(f"Failed timeseries insert for batch of {len(batch)} rows: {e}")
+
+
+# Run — stream the products CSV so memory stays bounded by one chunk
+for products in read_csv_chunks(PRODUCTS_CSV, CHUNK_SIZE, str_columns=("Product ID", "Fetched At"), columns=PRODUCT_COLUMNS):
+    upload_main_data(merge_sizes(products))
 
 print("Supabase sync complete.")
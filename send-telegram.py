@@ -1,11 +1,16 @@
 import os
+import re
+import numpy as np
 import pandas as pd
 import requests
-import json
-from pathlib import Path
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+from dataclasses import dataclass
 from dotenv import load_dotenv
 from datetime import datetime
 
+from utils import load_blocked_config, read_csv
+
 # 📂 Load environment variables
 load_dotenv()
 BOT_TOKEN = os.getenv('TELEGRAM_BOT_TOKEN')
@@ -14,46 +19,108 @@ CHAT_ID = os.getenv('TELEGRAM_CHAT_ID')
 # 📄 Paths
 CSV_PATH = 'product-ids/sizes-filtered.csv'
 BLOCKED_PATH = 'product-ids/blocked_ids.json'
+MESSAGE_COLUMNS = [
+    'Product ID', 'Product Name', 'Product URL', 'Discount %', 'Promo Price',
+    'Rating', 'Reviews', 'Action', 'Available Sizes', 'Fetched At',
+]
+TEXT_COLUMNS = ('Product ID', 'Product Name', 'Product URL', 'Action', 'Available Sizes', 'Fetched At')
+BLANK_COLUMNS = ['Available Sizes', 'Action']  # missing values here simply mean "nothing to show"
 
+_PIPE_RE = re.compile(r'\s*\|\s*')  # variant separator, surrounding whitespace included
+# name, url, discount, promo price, rating, reviews — %d truncates discount and reviews like int()
+_ITEM_FMT = "\n🔗 [%s](%s)\n💸 *-%d%%* | 🪙 %s | ⭐ %s (%d reviews)"
 
-# 🧠 Blocklist logic
-def is_blocked(product_id, sizes_str, blocklist):
-    if product_id not in blocklist:
-        return False
-
-    rule = blocklist[product_id]
 
-    # Fully blocked
-    if rule is True:
-        return True
-
-    if not sizes_str or pd.isna(sizes_str):
-        return False
+# 🧠 Blocklist logic
+@dataclass(frozen=True)
+class CompiledBlocklist:
+    fully_blocked: frozenset      # product IDs blocked outright
+    colors: dict                  # product ID → one compiled alternation of its uppercased blocked colors
+
+
+def _compile_blocklist(blocklist):
+    """Normalize the raw blocklist JSON once, before any rows are checked."""
+    return CompiledBlocklist(
+        fully_blocked=frozenset(pid for pid, rule in blocklist.items() if rule is True),
+        colors={
+            pid: re.compile('|'.join(re.escape(color.upper()) for color in rule))
+            for pid, rule in blocklist.items() if rule is not True and rule
+        },
+    )
+
+
+def blocked_mask(df, blocklist):
+    """Boolean mask of rows that are fully blocked or list a blocked color in their sizes."""
+    ids = df['Product ID']
+    mask = ids.isin(blocklist.fully_blocked).to_numpy(copy=True)
+    if 'Available Sizes' not in df:
+        return pd.Series(mask, index=df.index)
+
+    # Cheap checks first: only rows not yet blocked, with sizes, of a product that has color rules
+    pids = ids.astype(str)
+    sizes = df['Available Sizes']
+    has_rules = pids.isin(list(blocklist.colors)).to_numpy(dtype=bool)  # hash lookup; np.isin sorts the strings
+    pending = np.flatnonzero(~mask & (sizes != '').to_numpy(dtype=bool) & has_rules)
+
+    # Uppercase just the candidate rows, in one vectorized pass, then one regex scan per row
+    sizes_upper = sizes.iloc[pending].str.upper().to_numpy(dtype=object)
+    colors = blocklist.colors
+    mask[pending] = [colors[pid].search(s) is not None for pid, s in zip(pids.iloc[pending], sizes_upper)]
+    return pd.Series(mask, index=df.index)
 
-    sizes_str = sizes_str.upper()
-    blocked_colors = [color.upper() for color in rule]
 
-    return any(color in sizes_str for color in blocked_colors)
+# ✍️ Build message
+def format_items(df):
+    """One Markdown block per product row: a formatted head, then column-wise size and action lines."""
+    # Optional columns missing from the CSV render as empty, so every column below exists
+    df = df.reindex(columns=MESSAGE_COLUMNS, fill_value='')
+
+    rows = zip(
+        df['Product Name'], df['Product URL'], df['Discount %'].astype(float),
+        df['Promo Price'], df['Rating'], df['Reviews'].astype(float),
+    )
+    items = pd.Series([_ITEM_FMT % row for row in rows], index=df.index, dtype=object)
+
+    # 🧵 one line per non-empty variant, unless the product is unavailable
+    sizes = df['Available Sizes']
+    variants = sizes[sizes != 'Unavailable'].str.strip().str.split(_PIPE_RE).explode()
+    variants = variants[variants != '']
+    size_lines = ("\n🧵 `" + variants + "`").groupby(level=0).agg(''.join)
+    items += size_lines.reindex(df.index, fill_value='').astype(str)
+
+    action = df['Action']
+    items += ("\n🎯 _" + action + "_").where(action != '', '').astype(str)
+    return (items + "\n").tolist()
+
+
+def top_by_name(df, k):
+    """The first k rows of df sorted by Product Name descending, without sorting every row."""
+    names = df['Product Name']
+    present = names.dropna().to_numpy(dtype=object)
+    if len(present) > k:
+        # O(n) selection of the k-th largest name; ties at the cut-off stay in for the sort below
+        cutoff = np.partition(present, len(present) - k)[len(present) - k]
+        df = df[(names >= cutoff).fillna(False).to_numpy(dtype=bool)]
+    return df.sort_values(by='Product Name', ascending=False, kind='stable').head(k)
 
 
-# ✍️ Build message
 def create_message_from_csv(csv_path, max_items=40):
-    if not Path(csv_path).exists():
+    try:
+        df = read_csv(csv_path, str_columns=TEXT_COLUMNS, columns=MESSAGE_COLUMNS, allow_missing=True)
+    except FileNotFoundError:
         return "❌ No product data found."
-
-    df = pd.read_csv(csv_path)
+    df[BLANK_COLUMNS] = df[BLANK_COLUMNS].fillna('')
 
     if df.empty:
         return "ℹ️ No interesting products to report."
 
     # 🔒 Load blocked list
-    blocklist = {}
-    if Path(BLOCKED_PATH).exists():
-        with open(BLOCKED_PATH, 'r') as f:
-            blocklist = json.load(f)
+    blocklist = _compile_blocklist(load_blocked_config(BLOCKED_PATH))
 
     # 🧹 Filter blocked
-    df = df[~df.apply(lambda row: is_blocked(row['Product ID'], row.get('Available Sizes', ''), blocklist), axis=1)]
+    # Vectorized except for one regex search per row of a color-blocked product; that stays well under
+    # a second into the hundreds of thousands of rows, so a JIT/parallel kernel is not worth the dependency
+    df = df[~blocked_mask(df, blocklist)]
 
     if df.empty:
         return "ℹ️ All results were filtered by blocklist."
@@ -65,35 +132,29 @@ def create_message_from_csv(csv_path, max_items=40):
     except:
         date_str = 'Unknown Time'
 
-    df = df.sort_values(by='Product Name', ascending=False).head(max_items)
+    df = top_by_name(df, max_items)
 
-    message = f"*🛍️ UNIQLO Multi ({date_str})*\n"
+    # At most max_items rows are rendered, so formatting stays single-threaded
+    parts = [f"*🛍️ UNIQLO Multi ({date_str})*\n", *format_items(df)]
+    return ''.join(parts).strip()
 
-    for _, row in df.iterrows():
-        name = row['Product Name']
-        url = row['Product URL']
-        discount = row.get('Discount %', '')
-        rating = row.get('Rating', '')
-        reviews = row.get('Reviews', '')
-        action = row.get('Action', '')
-        sizes = row.get('Available Sizes', '')
-        promo = row.get('Promo Price', '')
 
-        message += f"\n🔗 [{name}]({url})"
-        message += f"\n💸 *-{int(discount)}%* | 🪙 {promo} | ⭐ {rating} ({int(float(reviews))} reviews)"
-        if sizes and sizes != 'Unavailable':
-            for variant in str(sizes).split('|'):
-                variant = variant.strip()
-                if variant:
-                    message += f"\n🧵 `{variant}`"
-        if action:
-            message += f"\n🎯 _{action}_"
-        message += "\n"
-
-    return message.strip()
+# 📤 Send to Telegram
+# One pooled session: keeps the TLS connection alive and backs off on rate limits / server errors
+_session = requests.Session()
+_session.mount('https://', HTTPAdapter(
+    pool_connections=1,
+    pool_maxsize=1,
+    max_retries=Retry(
+        total=3,
+        backoff_factor=0.5,
+        status_forcelist=[429, 500, 502, 503, 504],
+        allowed_methods=frozenset({'POST'}),
+        raise_on_status=False,  # hand the last response to the status check below
+    ),
+))
 
 
-# 📤 Send to Telegram
 def send_telegram(text):
     if not BOT_TOKEN or not CHAT_ID:
         print("❌ Missing Telegram credentials.")
@@ -108,7 +169,7 @@ def send_telegram(text):
     }
 
     try:
-        res = requests.post(url, json=payload)
+        res = _session.post(url, json=payload, timeout=10)
         if res.ok:
             print("✅ Telegram message sent")
         else:
@@ -0,0 +1,52 @@
+import sys
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+import pytest
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+
+import utils
+
+pytest.importorskip("pyarrow")
+
+
+def _run(**columns):
+    n = len(next(iter(columns.values())))
+    return pd.DataFrame({'Product ID': [f'E{i}' for i in range(n)], 'Fetched At': '2025-04-09T10:29:12Z', **columns})
+
+
+def test_append_history_reads_back_runs_with_different_inferred_types(tmp_path):
+    history = str(tmp_path / 'history')
+    # First run: blank URLs (Arrow null), integer ratings and a categorical action
+    utils.append_history(
+        _run(**{
+            'Color Variant URLs': [np.nan, np.nan],
+            'Rating': [4, 5],
+            'Action': pd.Categorical(['SUPER', 'AVOID']),
+        }),
+        history, utils.RAW_HISTORY_COLUMNS,
+    )
+    # Second run: real URLs, fractional ratings, a different category set
+    utils.append_history(
+        _run(**{
+            'Color Variant URLs': ['https://x/a?colorDisplayCode=09', ''],
+            'Rating': [4.5, 3.0],
+            'Action': pd.Categorical(['NEUTRAL', 'GOOD DEAL'], categories=['GOOD DEAL', 'NEUTRAL', 'SUPER']),
+        }),
+        history, utils.RAW_HISTORY_COLUMNS,
+    )
+
+    # Every run's files carry the same schema, whichever order the reader visits them in
+    pq = pytest.importorskip("pyarrow.parquet")
+    schemas = {str(pq.read_schema(f)) for f in Path(history).rglob('*.parquet')}
+    assert len(schemas) == 1
+
+    df = pd.read_parquet(history, filters=[('fetched_date', '>=', '2025-01-01')])
+
+    assert list(df.columns[:-1]) == list(utils.RAW_HISTORY_COLUMNS)
+    assert len(df) == 4
+    assert sorted(df['Rating']) == [3.0, 4.0, 4.5, 5.0]
+    assert sorted(df['Action']) == ['AVOID', 'GOOD DEAL', 'NEUTRAL', 'SUPER']
+    assert df['Color Variant URLs'].isna().sum() == 2
@@ -1,27 +1,162 @@
+import functools
 import json
 import os
+import uuid
+import numpy as np
 import pandas as pd
 from pathlib import Path
 
+try:
+    import pyarrow as pa
+    import pyarrow.csv as pa_csv
+    import pyarrow.parquet as pq
+except ImportError:  # optional — falls back to pd.read_csv / CSV history files
+    pa_csv = pq = None
 
+try:
+    import orjson
+except ImportError:  # optional — falls back to the stdlib json parser
+    orjson = None
+
+if pa_csv is not None:
+    # Arrow-backed strings with NaN as the missing value (the pandas 3 default 'str' dtype)
+    try:
+        ARROW_STR = pd.StringDtype('pyarrow', na_value=np.nan)
+    except TypeError:  # pandas < 2.3
+        ARROW_STR = pd.StringDtype('pyarrow_numpy')
+
+
+def _read_json(path) -> dict:
+    if orjson is not None:
+        return orjson.loads(Path(path).read_bytes())
+    with open(path, 'r') as f:
+        return json.load(f)
+
+
+@functools.lru_cache(maxsize=None)
 def load_country_config(country: str) -> dict:
     """Load config for a given country code from country-config.json."""
-    config_path = Path(__file__).parent / 'country-config.json'
-    with open(config_path, 'r') as f:
-        all_configs = json.load(f)
+    all_configs = _read_json(Path(__file__).parent / 'country-config.json')
     if country not in all_configs:
         raise ValueError(f"Unknown country '{country}'. Available: {list(all_configs.keys())}")
     return all_configs[country]
 
 
+@functools.lru_cache(maxsize=8)
+def _load_json_cached(path: str, mtime: float):
+    return _read_json(path)
+
+
+def load_blocked_config(path: str) -> dict:
+    """Load the blocklist JSON ({} if missing); re-parsed only when the file's mtime changes."""
+    try:
+        mtime = os.stat(path).st_mtime  # one stat covers both the existence check and the cache key
+    except FileNotFoundError:
+        return {}
+    return _load_json_cached(path, mtime)
+
+
+def read_csv(csv_path: str, str_columns: tuple = (), columns: list = None, allow_missing: bool = False) -> pd.DataFrame:
+    """Load a CSV with the multithreaded pyarrow parser when it is installed, else pd.read_csv.
+
+    Only `columns` are parsed when given; `str_columns` are kept as text. With `allow_missing`,
+    requested columns absent from the file come back all-null instead of raising.
+    """
+    # Keep timestamp-like columns as text so they are written back unchanged
+    if pa_csv is not None:
+        convert = pa_csv.ConvertOptions(
+            column_types={c: pa.string() for c in str_columns},
+            strings_can_be_null=True,
+            include_columns=columns,
+            include_missing_columns=allow_missing,
+        )
+        table = pa_csv.read_csv(csv_path, convert_options=convert)
+        # String columns stay in Arrow buffers, so .str/isin/== run on Arrow compute kernels
+        return table.to_pandas(types_mapper={pa.string(): ARROW_STR, pa.large_string(): ARROW_STR}.get)
+    usecols = (lambda c: c in columns) if columns and allow_missing else columns
+    df = pd.read_csv(csv_path, dtype={c: str for c in str_columns}, usecols=usecols)
+    return df.reindex(columns=columns) if columns else df
+
+
+def read_csv_chunks(csv_path: str, chunksize: int, str_columns: tuple = (), columns: list = None):
+    """Yield the CSV as DataFrames of at most `chunksize` rows; arguments as for read_csv."""
+    with pd.read_csv(csv_path, dtype={c: str for c in str_columns}, usecols=columns, chunksize=chunksize) as reader:
+        for chunk in reader:
+            yield chunk[columns] if columns else chunk
+
+
 def save_or_append_df(df: pd.DataFrame, csv_path: str):
     """
     Saves a DataFrame to a CSV file. Appends to the file if it exists, including only data rows (no header).
     If the file does not exist, creates it with headers.
     """
-    if os.path.exists(csv_path):
-        df.to_csv(csv_path, mode='a', header=False, index=False)
-        print(f"Appended {len(df)} rows to {csv_path}")
-    else:
-        df.to_csv(csv_path, index=False)
+    # A single append-mode open: an empty file at the start position is a new file and gets the header
+    with open(csv_path, 'a', newline='') as f:
+        is_new = f.tell() == 0
+        df.to_csv(f, header=is_new, index=False)
+    if is_new:
         print(f"Created new file and saved {len(df)} rows to {csv_path}")
+    else:
+        print(f"Appended {len(df)} rows to {csv_path}")
+
+
+# Column types of the history datasets. Every run is written with exactly these columns and types,
+# so files from runs whose values happened to infer differently (all-blank, all-integer) stay readable together.
+RAW_HISTORY_COLUMNS = {
+    'Product ID': 'string',
+    'Product Name': 'string',
+    'Price (Promo)': 'string',
+    'Price (Original)': 'string',
+    'Rating': 'float64',
+    'Reviews': 'float64',
+    'Product URL': 'string',
+    'Color Variant URLs': 'string',
+    'Fetched At': 'string',
+    'Promo Price': 'float64',
+    'Original Price': 'float64',
+    'Discount %': 'float64',
+    'Review_Score': 'float64',
+    'Review_Score_Quantile': 'float64',
+    'Discount_Quantile': 'float64',
+    'Action': 'string',
+}
+VERIFIED_HISTORY_COLUMNS = {
+    **{c: t for c, t in RAW_HISTORY_COLUMNS.items() if c not in ('Price (Promo)', 'Price (Original)')},
+    'Available Sizes': 'string',
+}
+
+
+def _history_frame(df: pd.DataFrame, columns: dict) -> pd.DataFrame:
+    """df reduced to `columns`, with plain strings/floats only (categoricals included) and missing columns all-null."""
+    df = df.reindex(columns=list(columns))
+    return df.assign(**{
+        c: pd.to_numeric(df[c], errors='coerce').astype(float) if t == 'float64' else df[c].astype('string')
+        for c, t in columns.items()
+    })
+
+
+def append_history(df: pd.DataFrame, history_path: str, columns: dict):
+    """
+    Appends a run to a history dataset. With pyarrow this is a Parquet dataset under `history_path`,
+    partitioned by the date of 'Fetched At' so each run only adds files; otherwise `history_path`.csv.
+    Only `columns` (name → Arrow type name) are kept, with those types, in every run.
+    Read it back with pd.read_parquet(history_path, filters=[('fetched_date', '>=', '2025-01-01')]).
+    """
+    if pq is None:
+        save_or_append_df(df, f"{history_path}.csv")
+        return
+
+    schema = pa.schema([(c, pa.type_for_alias(t)) for c, t in columns.items()])
+    history = _history_frame(df, columns)
+
+    # Hive-style partitions written file by file: pq.write_to_dataset runs through Arrow's threaded
+    # dataset writer, which intermittently aborted the interpreter at exit ("terminate called ...")
+    fetched = pd.to_datetime(df['Fetched At'], format='ISO8601', errors='coerce')
+    dates = fetched.dt.strftime('%Y-%m-%d').fillna('__HIVE_DEFAULT_PARTITION__')
+    run_id = uuid.uuid4().hex
+    for date, part in history.groupby(dates, sort=False):
+        part_dir = Path(history_path) / f"fetched_date={date}"
+        part_dir.mkdir(parents=True, exist_ok=True)
+        table = pa.Table.from_pandas(part, schema=schema, preserve_index=False)
+        pq.write_table(table, part_dir / f"{run_id}-0.parquet")
+    print(f"Appended {len(df)} rows to {history_path}/")